@@ -9,11 +9,13 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / "uploads"
 OUTPUT_DIR = BASE_DIR / "outputs"
 STYLE_IMAGES_DIR = BASE_DIR / "models" / "style_images"
+THUMBNAIL_DIR = OUTPUT_DIR / "thumbs"
 
 # Ensure directories exist
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 STYLE_IMAGES_DIR.mkdir(exist_ok=True)
+THUMBNAIL_DIR.mkdir(exist_ok=True)
 
 # Style transfer settings
 AVAILABLE_STYLES = {
@@ -39,9 +41,18 @@ AVAILABLE_STYLES = {
 MAX_IMAGE_SIZE = 512  # Max dimension for processing
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB read size when streaming uploads
+MAX_STATUS_WAIT = 30  # Max seconds /status may hold a long-poll open
+MAX_BATCH_RESULTS = 50  # Max job ids per /results:batch request
+THUMBNAIL_SIZE = 256  # Max dimension of result thumbnails
 
 # Model settings
 USE_GPU = False  # Set to True if you have GPU
+USE_QUANTIZED_MODEL = False  # Serve an FP16 TFLite conversion of the model
+MAX_BATCH_SIZE = 4  # Max concurrent jobs stacked into one model call
+BATCH_WAIT_MS = 50  # How long to wait for more jobs before running a batch
+INFERENCE_TIMEOUT = 600  # Max seconds a job waits for its batch (covers first model load)
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", MAX_BATCH_SIZE))  # Jobs processed at once
 NUM_ITERATIONS = 500  # For optimization-based style transfer
 CONTENT_WEIGHT = 1.0
 STYLE_WEIGHT = 1000.0
\ No newline at end of file
@@ -1,4 +1,5 @@
 import sqlite3
+import asyncio
 import aiosqlite
 from pathlib import Path
 from datetime import datetime
@@ -31,103 +32,201 @@ def init_db():
         )
     """)
     
+    # Indexes for the history and gallery queries
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_session_created
+        ON transformations(session_id, created_at DESC)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_status_created
+        ON transformations(status, created_at DESC)
+    """)
+    # Finished outputs keyed by uploaded content and style, for deduping jobs
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS style_cache (
+            content_hash TEXT NOT NULL,
+            style TEXT NOT NULL,
+            output_path TEXT NOT NULL,
+            PRIMARY KEY (content_hash, style)
+        )
+    """)
+    
+    cursor.execute("ANALYZE")
+    
     conn.commit()
     conn.close()
     print(f"✅ Database initialized at {DB_PATH}")
 
+# Non-terminal job states ("processing") live in memory; only terminal
+# states are written to disk, saving a commit per job
+_JOB_STATE: Dict[str, str] = {}
+TERMINAL_STATUSES = {"completed", "failed"}
+
+def _with_live_status(job: Dict) -> Dict:
+    """Overlay the in-memory status of a running job onto its row"""
+    if job["job_id"] in _JOB_STATE:
+        job["status"] = _JOB_STATE[job["job_id"]]
+    return job
+
+# SQL text is kept constant so sqlite3's prepared statement cache
+# (keyed by the exact string) is hit on every call
+_SQL_CREATE_JOB = """
+    INSERT INTO transformations 
+    (job_id, session_id, original_filename, original_path, style_name, status)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_SQL_COMPLETE_JOB = """
+    UPDATE transformations 
+    SET status = ?, output_path = ?, processing_time = ?, 
+        completed_at = CURRENT_TIMESTAMP
+    WHERE job_id = ?
+"""
+_SQL_FAIL_JOB = """
+    UPDATE transformations 
+    SET status = ?, error_message = ?, completed_at = CURRENT_TIMESTAMP
+    WHERE job_id = ?
+"""
+_SQL_GET_CACHED_OUTPUT = """
+    SELECT output_path FROM style_cache WHERE content_hash = ? AND style = ?
+"""
+_SQL_CACHE_OUTPUT = """
+    INSERT OR REPLACE INTO style_cache (content_hash, style, output_path)
+    VALUES (?, ?, ?)
+"""
+_SQL_GET_JOB = """
+    SELECT * FROM transformations WHERE job_id = ?
+"""
+_SQL_SESSION_HISTORY = """
+    SELECT * FROM transformations 
+    WHERE session_id = ? 
+    ORDER BY created_at DESC
+"""
+_SQL_GALLERY = """
+    SELECT * FROM transformations 
+    WHERE status = 'completed'
+    ORDER BY created_at DESC 
+    LIMIT ?
+"""
+
 # Async database operations
 class Database:
+    """Async access to the transformations table over one shared connection"""
+    
+    _conn: Optional[aiosqlite.Connection] = None
+    _write_lock = asyncio.Lock()
+    
+    @classmethod
+    async def connect(cls) -> aiosqlite.Connection:
+        """Open the shared connection and tune it for concurrent access"""
+        if cls._conn is None:
+            conn = await aiosqlite.connect(DB_PATH)
+            conn.row_factory = aiosqlite.Row
+            await conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA cache_size=-64000;
+            """)
+            cls._conn = conn
+        return cls._conn
     
-    @staticmethod
-    async def create_job(job_id: str, session_id: str, filename: str, 
+    @classmethod
+    async def close(cls):
+        """Close the shared connection"""
+        if cls._conn is not None:
+            await cls._conn.close()
+            cls._conn = None
+    
+    @classmethod
+    async def create_job(cls, job_id: str, session_id: str, filename: str, 
                          filepath: str, style: str) -> bool:
         """Create a new transformation job"""
-        async with aiosqlite.connect(DB_PATH) as db:
+        db = await cls.connect()
+        async with cls._write_lock:
             try:
-                await db.execute("""
-                    INSERT INTO transformations 
-                    (job_id, session_id, original_filename, original_path, style_name, status)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (job_id, session_id, filename, filepath, style, "pending"))
+                await db.execute(_SQL_CREATE_JOB, (job_id, session_id, filename, filepath, style, "pending"))
                 await db.commit()
                 return True
             except Exception as e:
+                await db.rollback()
                 print(f"Error creating job: {e}")
                 return False
     
-    @staticmethod
-    async def update_job_status(job_id: str, status: str, 
+    @classmethod
+    async def update_job_status(cls, job_id: str, status: str, 
                                 output_path: str = None,
                                 processing_time: float = None,
                                 error_message: str = None) -> bool:
         """Update job status"""
-        async with aiosqlite.connect(DB_PATH) as db:
+        if status not in TERMINAL_STATUSES:
+            _JOB_STATE[job_id] = status
+            return True
+        
+        db = await cls.connect()
+        async with cls._write_lock:
             try:
                 if status == "completed":
-                    await db.execute("""
-                        UPDATE transformations 
-                        SET status = ?, output_path = ?, processing_time = ?, 
-                            completed_at = CURRENT_TIMESTAMP
-                        WHERE job_id = ?
-                    """, (status, output_path, processing_time, job_id))
-                elif status == "failed":
-                    await db.execute("""
-                        UPDATE transformations 
-                        SET status = ?, error_message = ?, completed_at = CURRENT_TIMESTAMP
-                        WHERE job_id = ?
-                    """, (status, error_message, job_id))
+                    await db.execute(_SQL_COMPLETE_JOB, (status, output_path, processing_time, job_id))
                 else:
-                    await db.execute("""
-                        UPDATE transformations 
-                        SET status = ?
-                        WHERE job_id = ?
-                    """, (status, job_id))
+                    await db.execute(_SQL_FAIL_JOB, (status, error_message, job_id))
                 
                 await db.commit()
+                _JOB_STATE.pop(job_id, None)
                 return True
             except Exception as e:
+                await db.rollback()
                 print(f"Error updating job: {e}")
                 return False
     
-    @staticmethod
-    async def get_job(job_id: str) -> Optional[Dict]:
+    @classmethod
+    async def get_cached_output(cls, content_hash: str, style: str) -> Optional[str]:
+        """Get the output path of an earlier job with the same content and style"""
+        db = await cls.connect()
+        async with db.execute(_SQL_GET_CACHED_OUTPUT, (content_hash, style)) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return row["output_path"]
+            return None
+    
+    @classmethod
+    async def cache_output(cls, content_hash: str, style: str, output_path: str) -> bool:
+        """Remember the output of a completed job for later reuse"""
+        db = await cls.connect()
+        async with cls._write_lock:
+            try:
+                await db.execute(_SQL_CACHE_OUTPUT, (content_hash, style, output_path))
+                await db.commit()
+                return True
+            except Exception as e:
+                await db.rollback()
+                print(f"Error caching output: {e}")
+                return False
+    
+    @classmethod
+    async def get_job(cls, job_id: str) -> Optional[Dict]:
         """Get job details"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM transformations WHERE job_id = ?", (job_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return dict(row)
-                return None
+        db = await cls.connect()
+        async with db.execute(_SQL_GET_JOB, (job_id,)) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return _with_live_status(dict(row))
+            return None
     
-    @staticmethod
-    async def get_session_history(session_id: str) -> List[Dict]:
+    @classmethod
+    async def get_session_history(cls, session_id: str) -> List[Dict]:
         """Get all transformations for a session"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("""
-                SELECT * FROM transformations 
-                WHERE session_id = ? 
-                ORDER BY created_at DESC
-            """, (session_id,)) as cursor:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+        db = await cls.connect()
+        async with db.execute(_SQL_SESSION_HISTORY, (session_id,)) as cursor:
+            rows = await cursor.fetchall()
+            return [_with_live_status(dict(row)) for row in rows]
     
-    @staticmethod
-    async def get_all_transformations(limit: int = 50) -> List[Dict]:
+    @classmethod
+    async def get_all_transformations(cls, limit: int = 50) -> List[Dict]:
         """Get recent transformations (for gallery)"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("""
-                SELECT * FROM transformations 
-                WHERE status = 'completed'
-                ORDER BY created_at DESC 
-                LIMIT ?
-            """, (limit,)) as cursor:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+        db = await cls.connect()
+        async with db.execute(_SQL_GALLERY, (limit,)) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
 
 # Initialize database on import
 init_db()
\ No newline at end of file
@@ -1,27 +1,26 @@
-
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import shutil
-import os
+import aiofiles
 import asyncio
+import hashlib
+import io
+import zipfile
 from pathlib import Path
 from datetime import datetime
 import uuid
 import time
-from style_transfer import StyleTransfer
-from config import MODEL_DIR
-from typing import Optional
-from pydantic import BaseModel
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
-from fastapi.responses import HTMLResponse
+from typing import List, Literal, Optional
+from PIL import Image
 
-from database import Database
+from style_transfer import StyleTransfer, InferenceBatcher, get_stylizer
+from database import Database, TERMINAL_STATUSES
 from config import (
-    UPLOAD_DIR, OUTPUT_DIR, AVAILABLE_STYLES, 
-    ALLOWED_EXTENSIONS, MAX_FILE_SIZE
+    UPLOAD_DIR, OUTPUT_DIR, STYLE_IMAGES_DIR, AVAILABLE_STYLES, 
+    ALLOWED_EXTENSIONS, MAX_FILE_SIZE, UPLOAD_CHUNK_SIZE,
+    MAX_BATCH_SIZE, BATCH_WAIT_MS, INFERENCE_TIMEOUT, MAX_CONCURRENT_JOBS, MAX_STATUS_WAIT,
+    MAX_BATCH_RESULTS, THUMBNAIL_DIR, THUMBNAIL_SIZE
 )
 
 app = FastAPI(
@@ -39,38 +38,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Define paths
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOAD_DIR = BASE_DIR / "uploads"
-OUTPUT_DIR = BASE_DIR / "outputs"
+# Coalesces concurrent jobs into batched model calls
+batcher = InferenceBatcher(
+    max_batch=MAX_BATCH_SIZE, max_wait_ms=BATCH_WAIT_MS, timeout=INFERENCE_TIMEOUT
+)
+
+# Bounds how many jobs load, stylize and save images at once
+job_semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+
+# Set when a job completes or fails, for long-polling /status
+_job_events: dict[str, asyncio.Event] = {}
+
+# Open the shared database connection once per process
+@app.on_event("startup")
+async def startup():
+    await Database.connect()
+    app.state.batcher_task = asyncio.create_task(batcher.run())
+    # Warm the style model in the background so startup isn't blocked
+    app.state.model_warmup = asyncio.create_task(warm_model())
 
-# Create directories if they don't exist
-UPLOAD_DIR.mkdir(exist_ok=True)
-OUTPUT_DIR.mkdir(exist_ok=True)
+@app.on_event("shutdown")
+async def shutdown():
+    await Database.close()
+
+async def warm_model():
+    """Load the style transfer model and style images off the event loop"""
+    try:
+        await asyncio.to_thread(get_stylizer)
+        st = StyleTransfer(max_dim=512)
+        for style in AVAILABLE_STYLES:
+            style_path = STYLE_IMAGES_DIR / f"{style}.jpg"
+            if style_path.exists():
+                await asyncio.to_thread(st.load_style_image, style_path)
+    except Exception as e:
+        print(f"⚠️  Model warm-up failed, will retry on first job: {e}")
+
+# Read templates once at import; they never change while the server runs
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+_TEMPLATE_CACHE: dict[str, str] = {
+    path.name: path.read_text(encoding="utf-8")
+    for path in TEMPLATE_DIR.glob("*.html")
+}
 
 def load_template(template_name: str) -> str:
-    """Load HTML template from file"""
-    template_path = Path(__file__).parent / "templates" / template_name
-    with open(template_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    """Load HTML template from the in-memory cache"""
+    return _TEMPLATE_CACHE[template_name]
 
-# Root endpoint
-@app.get("/", response_class=HTMLResponse)
-# @app.get("/")
-async def root():
-    """Serve the landing page"""
-    return load_template("index.html")
-    # return {
-    #     "message": "mimicryML | AI Style Transfer API",
-    #     "status": "running",
-    #     "endpoints": {
-    #         "health": "/health",
-    #         "transform": "/transform",
-    #         "status": "/status/{job_id}",
-    #         "result": "/result/{job_id}",
-    #         "history": "/history"
-    #     }
-    # }
+_INDEX_RESPONSE = HTMLResponse(load_template("index.html"))
 
 # Health check
 @app.get("/health")
@@ -105,6 +119,12 @@ class JobStatus(BaseModel):
     output_path: Optional[str] = None
     error_message: Optional[str] = None
 
+ResultSize = Literal["full", "thumb"]
+
+class BatchResultsRequest(BaseModel):
+    ids: List[str]
+    size: ResultSize = "full"
+
 # Helper functions
 def validate_image(file: UploadFile) -> bool:
     """Validate uploaded image"""
@@ -117,25 +137,58 @@ def validate_image(file: UploadFile) -> bool:
         )
     return True
 
-async def save_upload(file: UploadFile) -> Path:
-    """Save uploaded file"""
+def ensure_thumbnail(output_path: Path) -> Path:
+    """Return the thumbnail for a result, creating it on first request"""
+    thumb_path = THUMBNAIL_DIR / output_path.name
+    if not thumb_path.exists():
+        with Image.open(output_path) as img:
+            img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+            # Write then rename so a concurrent request never reads a partial file
+            tmp_path = thumb_path.with_name(f"{uuid.uuid4()}.tmp")
+            img.save(tmp_path, format="JPEG", quality=85)
+        tmp_path.replace(thumb_path)
+    return thumb_path
+
+async def save_upload(file: UploadFile) -> tuple[Path, str]:
+    """Save uploaded file and return its path and SHA-256 digest"""
     # Generate unique filename
     ext = Path(file.filename).suffix
     unique_name = f"{uuid.uuid4()}{ext}"
     file_path = UPLOAD_DIR / unique_name
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"File too large. Max size: {MAX_FILE_SIZE // (1024 * 1024)}MB"
+    )
+    
+    # Reject up front when the multipart parser already knows the size
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise too_large
     
-    return file_path
+    # Single pass over the upload: size check, hash and write per chunk,
+    # streamed so the event loop is never blocked
+    total = 0
+    digest = hashlib.sha256()
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total += len(chunk)
+                if total > MAX_FILE_SIZE:
+                    raise too_large
+                digest.update(chunk)
+                await buffer.write(chunk)
+    except HTTPException:
+        file_path.unlink(missing_ok=True)
+        raise
+    
+    return file_path, digest.hexdigest()
 
 # Endpoints 
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Serve the landing page"""
-    return load_template("index.html")
+    return _INDEX_RESPONSE
 
 @app.get("/styles")
 async def get_styles():
@@ -176,7 +229,7 @@ async def transform_image(
     
     try:
         # Save uploaded file
-        file_path = await save_upload(file)
+        file_path, content_hash = await save_upload(file)
         
         # Create database entry
         await Database.create_job(
@@ -187,9 +240,25 @@ async def transform_image(
             style=style
         )
         
+        # Reuse the result of an identical earlier transformation
+        cached_output = await Database.get_cached_output(content_hash, style)
+        if cached_output and Path(cached_output).exists():
+            await Database.update_job_status(
+                job_id=job_id,
+                status="completed",
+                output_path=cached_output,
+                processing_time=0.0
+            )
+            return TransformResponse(
+                job_id=job_id,
+                status="completed",
+                message="Image uploaded successfully. Result reused from cache."
+            )
+        
         # Add processing to background tasks
-        # (We'll implement the actual processing in next step)
-        background_tasks.add_task(process_style_transfer, job_id, str(file_path), style)
+        background_tasks.add_task(
+            process_style_transfer, job_id, str(file_path), style, content_hash
+        )
         
         return TransformResponse(
             job_id=job_id,
@@ -197,22 +266,44 @@ async def transform_image(
             message="Image uploaded successfully. Processing started."
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/status/{job_id}", response_model=JobStatus)
-async def get_job_status(job_id: str):
-    """Get status of a transformation job"""
+async def get_job_status(job_id: str, wait: float = 0):
+    """
+    Get status of a transformation job
+    With wait > 0, hold the request open (up to MAX_STATUS_WAIT seconds)
+    until the job completes or fails
+    """
     job = await Database.get_job(job_id)
     
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
+    if wait > 0 and job['status'] not in TERMINAL_STATUSES:
+        event = _job_events.setdefault(job_id, asyncio.Event())
+        # Re-read: the job may have finished before the event was registered
+        job = await Database.get_job(job_id)
+        if job['status'] in TERMINAL_STATUSES:
+            # Nothing will clean this event up now, so drop it ourselves
+            # (waking anyone else already waiting on it)
+            _job_events.pop(job_id, None)
+            event.set()
+        else:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(wait, MAX_STATUS_WAIT))
+                job = await Database.get_job(job_id)
+            except asyncio.TimeoutError:
+                pass
+    
     return JobStatus(**job)
 
 @app.get("/result/{job_id}")
-async def get_result(job_id: str):
-    """Download the stylized image"""
+async def get_result(job_id: str, request: Request, size: ResultSize = "full"):
+    """Download the stylized image (size=thumb for a small preview)"""
     job = await Database.get_job(job_id)
     
     if not job:
@@ -228,12 +319,56 @@ async def get_result(job_id: str):
     if not output_path.exists():
         raise HTTPException(status_code=404, detail="Result file not found")
     
+    # Results never change once a job completes, so clients may cache them
+    headers = {
+        "ETag": f'"{job_id}"' if size == "full" else f'"{job_id}-{size}"',
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    if size == "thumb":
+        output_path = await asyncio.to_thread(ensure_thumbnail, output_path)
+    
     return FileResponse(
         output_path,
         media_type="image/jpeg",
-        filename=f"stylized_{job_id}.jpg"
+        filename=f"stylized_{job_id}.jpg",
+        headers=headers
     )
 
+@app.post("/results:batch")
+async def get_results_batch(request: BatchResultsRequest):
+    """
+    Download several stylized images in one zip archive
+    Entries are named {job_id}.jpg; unknown or unfinished jobs are skipped
+    """
+    if len(request.ids) > MAX_BATCH_RESULTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many ids. Max: {MAX_BATCH_RESULTS}"
+        )
+    
+    paths = {}
+    for job_id in dict.fromkeys(request.ids):
+        job = await Database.get_job(job_id)
+        if job and job['status'] == 'completed' and job['output_path']:
+            paths[job_id] = Path(job['output_path'])
+    
+    def build_zip() -> bytes:
+        buffer = io.BytesIO()
+        # JPEGs are already compressed, so store them as-is
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for job_id, path in paths.items():
+                if path.exists():
+                    if request.size == "thumb":
+                        path = ensure_thumbnail(path)
+                    archive.write(path, f"{job_id}.jpg")
+        return buffer.getvalue()
+    
+    content = await asyncio.to_thread(build_zip)
+    return Response(content=content, media_type="application/zip")
+
 @app.get("/history/{session_id}")
 async def get_history(session_id: str):
     """Get transformation history for a session"""
@@ -253,7 +388,8 @@ async def get_gallery(limit: int = 20):
         "transformations": transformations
     }
 
-async def process_style_transfer(job_id: str, image_path: str, style: str):
+async def process_style_transfer(job_id: str, image_path: str, style: str,
+                                 content_hash: Optional[str] = None):
     """
     Process style transfer with actual ML model
     """
@@ -267,8 +403,7 @@ async def process_style_transfer(job_id: str, image_path: str, style: str):
         await Database.update_job_status(job_id, "processing")
         
         # Get style image path
-        style_dir = Path(__file__).resolve().parent.parent / "models" / "style_images" 
-        style_path = style_dir / f"{style}.jpg" # Loads style.jpg
+        style_path = STYLE_IMAGES_DIR / f"{style}.jpg"
         
         if not style_path.exists():
             raise FileNotFoundError(f"Style image not found: {style}.jpg")
@@ -276,15 +411,19 @@ async def process_style_transfer(job_id: str, image_path: str, style: str):
         # Output path
         output_path = OUTPUT_DIR / f"{job_id}.jpg"
         
-        # Create style transfer instance and apply
-        start_time = time.time()
-        st = StyleTransfer(max_dim=512)
-        result = st.apply_style(
-            content_path=Path(image_path),
-            style_path=style_path,
-            output_path=output_path
-        )
-        processing_time = time.time() - start_time
+        # Create style transfer instance and apply in a worker thread
+        # so inference doesn't block the event loop
+        async with job_semaphore:
+            start_time = time.time()
+            st = StyleTransfer(max_dim=512)
+            result = await asyncio.to_thread(
+                st.apply_style,
+                content_path=Path(image_path),
+                style_path=style_path,
+                output_path=output_path,
+                stylize=batcher
+            )
+            processing_time = time.time() - start_time
         
         if result["success"]:
             # Update database with success
@@ -294,6 +433,8 @@ async def process_style_transfer(job_id: str, image_path: str, style: str):
                 output_path=str(output_path),
                 processing_time=processing_time
             )
+            if content_hash:
+                await Database.cache_output(content_hash, style, str(output_path))
             print(f"\n✅ Job {job_id} completed successfully!\n")
         else:
             # Update database with failure
@@ -310,10 +451,9 @@ async def process_style_transfer(job_id: str, image_path: str, style: str):
             job_id=job_id,
             status="failed",
             error_message=str(e)
-        ) 
-
-def load_template(template_name: str) -> str:
-    """Load HTML template from file"""
-    template_path = Path(__file__).parent / "templates" / template_name
-    with open(template_path, 'r', encoding='utf-8') as f:
-        return f.read()
\ No newline at end of file
+        )
+    finally:
+        # Wake any long-polling /status requests
+        event = _job_events.pop(job_id, None)
+        if event:
+            event.set() 
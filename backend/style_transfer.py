@@ -1,15 +1,223 @@
 import tensorflow as tf
 import tensorflow_hub as hub
-import numpy as np
-from PIL import Image
 from pathlib import Path
+import asyncio
+import gc
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from config import MODEL_DIR, USE_QUANTIZED_MODEL
 
-# Load the style transfer model (this happens once when module is imported)
-print("🔄 Loading TensorFlow Hub style transfer model...")
 MODEL_URL = "https://tfhub.dev/google/magenta/arbitrary-image-stylization-v1-256/2"
-hub_model = hub.load(MODEL_URL)
-print("✅ Model loaded successfully!")
+SAVED_STYLIZER_PATH = Path(MODEL_DIR) / "stylize_fn"
+QUANTIZED_MODEL_PATH = Path(MODEL_DIR) / "stylize_fp16.tflite"
+
+# The style transfer model is loaded on first use, not at import
+_stylizer_module = None
+_stylize = None
+_model_lock = threading.Lock()
+
+# Any batch of RGB images; a single trace covers every input size
+_IMAGE_SPEC = tf.TensorSpec(shape=(None, None, None, 3), dtype=tf.float32)
+
+class TFLiteStylizer:
+    """Run the quantized TFLite conversion of the style transfer model"""
+    
+    def __init__(self, model_path: Path):
+        self.interpreter = tf.lite.Interpreter(
+            model_path=str(model_path),
+            num_threads=os.cpu_count()
+        )
+        # The interpreter is stateful, so calls are serialized
+        self._lock = threading.Lock()
+        
+        inputs = self.interpreter.get_input_details()
+        self._content_index = next(d["index"] for d in inputs if "content" in d["name"])
+        self._style_index = next(d["index"] for d in inputs if "style" in d["name"])
+        self._output_index = self.interpreter.get_output_details()[0]["index"]
+    
+    def __call__(self, content_image: tf.Tensor, style_image: tf.Tensor) -> tf.Tensor:
+        with self._lock:
+            interpreter = self.interpreter
+            # Inputs have dynamic height/width, so resize to each request
+            interpreter.resize_tensor_input(self._content_index, content_image.shape, strict=False)
+            interpreter.resize_tensor_input(self._style_index, style_image.shape, strict=False)
+            interpreter.allocate_tensors()
+            interpreter.set_tensor(self._content_index, content_image.numpy())
+            interpreter.set_tensor(self._style_index, style_image.numpy())
+            interpreter.invoke()
+            return tf.convert_to_tensor(interpreter.get_tensor(self._output_index))
+
+def _convert_to_tflite(module) -> bytes:
+    """Convert the saved stylize function to TFLite with FP16 weights"""
+    concrete_fn = module.stylize.get_concrete_function()
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete_fn], module)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS,
+        tf.lite.OpsSet.SELECT_TF_OPS,
+    ]
+    return converter.convert()
+
+def _export_stylizer():
+    """Download the TF Hub model, trace it and save only the stylize function"""
+    hub_model = hub.load(MODEL_URL)
+    
+    @tf.function(input_signature=[_IMAGE_SPEC, _IMAGE_SPEC])
+    def stylize(content_image, style_image):
+        return hub_model(content_image, style_image)[0]
+    
+    # Track only the variables the traced graph captures; attaching the hub
+    # object itself would re-save all of its functions and signatures. The
+    # hub object is released when this returns (saving retraces stylize,
+    # so it has to stay reachable until then)
+    concrete_fn = stylize.get_concrete_function()
+    module = tf.Module()
+    module.captured_variables = list(concrete_fn.variables)
+    module.stylize = stylize
+    
+    # Save next to the final path and rename, so an interrupted export
+    # is never mistaken for a complete one
+    tmp_path = SAVED_STYLIZER_PATH.with_name(SAVED_STYLIZER_PATH.name + ".tmp")
+    tf.saved_model.save(module, str(tmp_path))
+    os.replace(tmp_path, SAVED_STYLIZER_PATH)
+
+def get_stylizer():
+    """
+    Load the style transfer model once and return its stylize function
+    (thread-safe)
+    
+    Returns:
+        Callable mapping (content_image, style_image) to the stylized
+        image tensor
+    """
+    global _stylizer_module, _stylize
+    if _stylize is None:
+        with _model_lock:
+            if _stylize is None:
+                # Reuse a previously converted quantized model if present
+                if USE_QUANTIZED_MODEL and QUANTIZED_MODEL_PATH.exists():
+                    print("🔄 Loading quantized style transfer model...")
+                    _stylize = TFLiteStylizer(QUANTIZED_MODEL_PATH)
+                    print("✅ Model loaded successfully!")
+                    return _stylize
+                
+                # First run: export the traced function, then drop the
+                # full hub object so only the slim artifact stays resident
+                if not SAVED_STYLIZER_PATH.exists():
+                    print("🔄 Downloading TensorFlow Hub style transfer model...")
+                    _export_stylizer()
+                    gc.collect()
+                
+                print("🔄 Loading style transfer model...")
+                module = tf.saved_model.load(str(SAVED_STYLIZER_PATH))
+                
+                if USE_QUANTIZED_MODEL:
+                    print("🔄 Converting model to FP16 TFLite...")
+                    QUANTIZED_MODEL_PATH.write_bytes(_convert_to_tflite(module))
+                    _stylize = TFLiteStylizer(QUANTIZED_MODEL_PATH)
+                else:
+                    # Keep the module alive; the function uses its variables
+                    _stylizer_module = module
+                    _stylize = module.stylize
+                print("✅ Model loaded successfully!")
+    return _stylize
+
+class InferenceBatcher:
+    """
+    Coalesce concurrent stylize calls into batched model invocations
+    
+    Requests are collected for up to max_wait_ms (or until max_batch are
+    waiting). Requests whose content and style images have the same shapes
+    are stacked into one model call; the rest run on their own.
+    
+    Batches run on the batcher's own thread rather than the default
+    executor: callers block a default-executor thread while they wait, so
+    sharing that pool could leave no thread free to run the batch.
+    """
+    
+    def __init__(self, max_batch: int = 4, max_wait_ms: int = 50, timeout: float = 600):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def run(self):
+        """Collect and run batches forever (start once on the server loop)"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Only images with matching shapes can be stacked together
+            groups: dict[tuple, list] = {}
+            for item in batch:
+                key = (tuple(item[0].shape), tuple(item[1].shape))
+                groups.setdefault(key, []).append(item)
+            
+            for group in groups.values():
+                await self._run_group(group)
+    
+    async def _run_group(self, group: list):
+        contents, styles, futures = zip(*group)
+        try:
+            outputs = await self._loop.run_in_executor(
+                self._executor, self._stylize_batch, contents, styles
+            )
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future, output in zip(futures, outputs):
+                if not future.done():
+                    future.set_result(output)
+    
+    @staticmethod
+    def _stylize_batch(contents, styles) -> list:
+        stylize = get_stylizer()
+        if len(contents) == 1:
+            return [stylize(contents[0], styles[0])]
+        stylized = stylize(tf.concat(contents, axis=0), tf.concat(styles, axis=0))
+        return tf.split(stylized, len(contents), axis=0)
+    
+    async def _submit(self, content_image: tf.Tensor, style_image: tf.Tensor) -> tf.Tensor:
+        future = self._loop.create_future()
+        await self._queue.put((content_image, style_image, future))
+        return await future
+    
+    def __call__(self, content_image: tf.Tensor, style_image: tf.Tensor) -> tf.Tensor:
+        """Stylize from a worker thread, blocking until the batch has run"""
+        if self._loop is None:
+            # Batcher isn't running (e.g. outside the server), call directly
+            return get_stylizer()(content_image, style_image)
+        future = asyncio.run_coroutine_threadsafe(
+            self._submit(content_image, style_image), self._loop
+        )
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Style transfer did not finish within {self.timeout}s")
+
+# Preprocessed style images, keyed by (style name, max_dim)
+_STYLE_CACHE: dict[tuple[str, int], tf.Tensor] = {}
 
 class StyleTransfer:
     """Handle neural style transfer operations"""
@@ -27,72 +235,79 @@ class StyleTransfer:
         Returns:
             Preprocessed image tensor
         """
-        # Load image
-        img = Image.open(image_path)
-        
-        # Convert RGBA to RGB if necessary
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
+        # Read and decode (RGBA/grayscale are mapped to 3 channels)
+        raw = tf.io.read_file(str(image_path))
+        img = tf.io.decode_image(raw, channels=3, expand_animations=False)
         
         # Resize while maintaining aspect ratio
-        img = self._resize_image(img)
-        
-        # Convert to array and normalize to [0, 1]
-        img_array = np.array(img) / 255.0
+        target_size = self._target_size(img.shape[0], img.shape[1])
+        img = tf.image.resize(img, target_size, method="lanczos3")
         
-        # Add batch dimension and convert to float32
-        img_tensor = tf.convert_to_tensor(img_array, dtype=tf.float32)
-        img_tensor = tf.expand_dims(img_tensor, 0)
-        
-        return img_tensor
+        # Normalize to [0, 1] and add batch dimension
+        img = tf.clip_by_value(img / 255.0, 0.0, 1.0)
+        return tf.expand_dims(img, 0)
     
-    def _resize_image(self, image: Image.Image) -> Image.Image:
+    def load_style_image(self, style_path: Path) -> tf.Tensor:
         """
-        Resize image to max_dim while maintaining aspect ratio
+        Load a style image, reusing the cached tensor when available
         
         Args:
-            image: PIL Image
+            style_path: Path to style image file
             
         Returns:
-            Resized PIL Image
+            Preprocessed style image tensor
         """
-        width, height = image.size
-        
-        # Calculate new dimensions
-        if width > height:
-            new_width = self.max_dim
-            new_height = int(height * (self.max_dim / width))
-        else:
-            new_height = self.max_dim
-            new_width = int(width * (self.max_dim / height))
-        
-        return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        key = (style_path.stem, self.max_dim)
+        style_image = _STYLE_CACHE.get(key)
+        if style_image is None:
+            style_image = _STYLE_CACHE.setdefault(key, self.load_image(style_path))
+        return style_image
     
-    def tensor_to_image(self, tensor: tf.Tensor) -> Image.Image:
+    def load_images(self, content_path: Path, style_path: Path) -> tuple[tf.Tensor, tf.Tensor]:
         """
-        Convert tensor back to PIL Image
+        Load the content and style images, decoding both in parallel when
+        the style image isn't cached yet
         
         Args:
-            tensor: Image tensor
+            content_path: Path to content image
+            style_path: Path to style image
             
         Returns:
-            PIL Image
+            Preprocessed (content, style) image tensors
         """
-        # Remove batch dimension
-        tensor = tensor[0]
+        if (style_path.stem, self.max_dim) in _STYLE_CACHE:
+            return self.load_image(content_path), self.load_style_image(style_path)
         
-        # Clip values to [0, 1] and convert to [0, 255]
-        tensor = tf.clip_by_value(tensor, 0, 1)
-        tensor = tensor * 255
+        # TF decode/resize kernels release the GIL, so a second thread
+        # overlaps the two decodes
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            style_future = pool.submit(self.load_style_image, style_path)
+            content_image = self.load_image(content_path)
+            return content_image, style_future.result()
+    
+    def _target_size(self, height: int, width: int) -> tuple[int, int]:
+        """
+        Compute the size that fits max_dim while maintaining aspect ratio
         
-        # Convert to numpy array
-        array = tensor.numpy().astype(np.uint8)
+        Args:
+            height: Original image height
+            width: Original image width
+            
+        Returns:
+            Target (height, width)
+        """
+        # Calculate new dimensions
+        if width > height:
+            new_width = self.max_dim
+            new_height = int(height * (self.max_dim / width))
+        else:
+            new_height = self.max_dim
+            new_width = int(width * (self.max_dim / height))
         
-        # Create PIL image
-        return Image.fromarray(array)
+        return new_height, new_width
     
     def apply_style(self, content_path: Path, style_path: Path, 
-                    output_path: Path) -> dict:
+                    output_path: Path, stylize=None) -> dict:
         """
         Apply artistic style to content image
         
@@ -100,6 +315,8 @@ class StyleTransfer:
             content_path: Path to content image
             style_path: Path to style image
             output_path: Path to save result
+            stylize: Optional callable used instead of the model directly
+                (e.g. an InferenceBatcher)
             
         Returns:
             Dictionary with processing info
@@ -109,21 +326,25 @@ class StyleTransfer:
         try:
             # Load images
             print(f"  📷 Loading content image: {content_path.name}")
-            content_image = self.load_image(content_path)
-            
             print(f"  🎨 Loading style image: {style_path.name}")
-            style_image = self.load_image(style_path)
+            content_image, style_image = self.load_images(content_path, style_path)
             
             # Apply style transfer
             print(f"  🔄 Applying style transfer...")
-            stylized_image = hub_model(content_image, style_image)[0]
+            stylize = stylize or get_stylizer()
+            stylized_image = stylize(content_image, style_image)
             
-            # Convert back to PIL Image
-            result_image = self.tensor_to_image(stylized_image)
+            # Convert to uint8 and encode straight to JPEG in TensorFlow
+            result_image = tf.image.convert_image_dtype(
+                stylized_image[0], tf.uint8, saturate=True
+            )
             
             # Save result
             print(f"  💾 Saving result to: {output_path.name}")
-            result_image.save(output_path, quality=95)
+            tf.io.write_file(
+                str(output_path),
+                tf.io.encode_jpeg(result_image, quality=95, optimize_size=True)
+            )
             
             processing_time = time.time() - start_time
             
@@ -134,7 +355,7 @@ class StyleTransfer:
                 "processing_time": processing_time,
                 "output_path": str(output_path),
                 "output_size": output_path.stat().st_size,
-                "dimensions": result_image.size
+                "dimensions": (int(result_image.shape[1]), int(result_image.shape[0]))
             }
             
         except Exception as e:
@@ -1,6 +1,83 @@
-from PIL import Image, ImageDraw
+from PIL import Image
 import numpy as np
 from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import io
+
+SIZE = 512
+# optimize/progressive only change the entropy coding, not the pixels
+JPEG_OPTIONS = {"quality": 95, "optimize": True, "progressive": True}
+
+@lru_cache(maxsize=None)
+def _wave(func: str, period: int, length: int = SIZE) -> np.ndarray:
+    """Lookup table of np.<func>(k / period) for k in [0, length), computed once per process"""
+    table = getattr(np, func)(np.arange(length) / period)
+    table.flags.writeable = False
+    return table
+
+# Pixel coordinates as broadcastable column/row index vectors; the sin/cos
+# terms come from 1-D lookup tables indexed by these
+_COLS = np.arange(SIZE)[None, :]
+_ROWS = np.arange(SIZE)[:, None]
+
+def _encode(arr: np.ndarray) -> bytes:
+    """JPEG-encode an RGB array"""
+    buf = io.BytesIO()
+    Image.fromarray(arr, 'RGB').save(buf, 'JPEG', **JPEG_OPTIONS)
+    return buf.getvalue()
+
+# Each generator is a top-level function so it can run in a worker
+# process; it returns (filename, JPEG bytes) and the parent writes the file
+
+def make_vangogh():
+    """Van Gogh - Swirly blue/yellow pattern"""
+    # (float work is done in place and cast once when stored into arr)
+    val = _wave("sin", 20)[_COLS] + _wave("cos", 20)[_ROWS]
+    val *= 127
+    val += 128
+    np.clip(val, 0, 255, out=val)
+    arr = np.empty((SIZE, SIZE, 3), np.uint8)
+    arr[..., 0] = 30  # Blue/yellow tones
+    arr[..., 1] = 50
+    arr[..., 2] = val
+    return "vangogh.jpg", _encode(arr)
+
+def make_picasso():
+    """Picasso - Geometric cubist pattern"""
+    # (an 8x8 grid of colour indices, each cell blown up to a 64px tile)
+    colors = np.array([(200, 180, 160), (180, 160, 140), (160, 140, 120), (140, 120, 100)], np.uint8)
+    tiles = SIZE // 64
+    grid = colors[np.add.outer(np.arange(tiles), np.arange(tiles)) % len(colors)]
+    arr = grid.repeat(64, axis=0).repeat(64, axis=1)
+    return "picasso.jpg", _encode(arr)
+
+def make_monet():
+    """Monet - Soft impressionist colors"""
+    # (r and g vary along one axis only, so they stay 1-D until stored)
+    arr = np.empty((SIZE, SIZE, 3), np.uint8)
+    arr[..., 0] = 150 + 50 * _wave("sin", 30)[_COLS]
+    arr[..., 1] = 180 + 50 * _wave("cos", 30)[_ROWS]
+    b = _wave("sin", 40, 2 * SIZE - 1)[_COLS + _ROWS]
+    b *= 30
+    b += 200
+    arr[..., 2] = b
+    return "monet.jpg", _encode(arr)
+
+def make_kandinsky():
+    """Kandinsky - Abstract bold colors"""
+    # (shapes are boolean masks over the coordinate grid, painted in order)
+    arr = np.empty((SIZE, SIZE, 3), np.uint8)
+    arr[...] = (255, 220, 100)
+    # Circle inscribed in the box [100, 400]
+    arr[(_COLS - 250) ** 2 + (_ROWS - 250) ** 2 <= 150.5 ** 2] = (255, 100, 100)
+    # Triangle (0, 0), (512, 0), (256, 512)
+    arr[2 * np.abs(_COLS - 256) <= SIZE - _ROWS] = (100, 100, 255)
+    # Vertical band over columns 200..312
+    arr[:, 200:313] = (50, 200, 150)
+    return "kandinsky.jpg", _encode(arr)
+
+GENERATORS = [make_vangogh, make_picasso, make_monet, make_kandinsky]
 
 def create_sample_styles():
     """Create sample style images using PIL"""
@@ -9,52 +86,17 @@ def create_sample_styles():
     
     print("🎨 Creating sample style images...")
     
-    # Van Gogh - Swirly blue/yellow pattern
-    img = Image.new('RGB', (512, 512))
-    pixels = img.load()
-    for i in range(512):
-        for j in range(512):
-            # Create swirly pattern
-            val = int((np.sin(i/20) + np.cos(j/20)) * 127 + 128)
-            pixels[i, j] = (30, 50, val)  # Blue/yellow tones
-    img.save(style_dir / "vangogh.jpg", quality=95)
-    print("  ✓ vangogh.jpg")
-    
-    # Picasso - Geometric cubist pattern
-    img = Image.new('RGB', (512, 512), (240, 230, 210))
-    draw = ImageDraw.Draw(img)
-    colors = [(200, 180, 160), (180, 160, 140), (160, 140, 120), (140, 120, 100)]
-    for i in range(0, 512, 64):
-        for j in range(0, 512, 64):
-            color = colors[(i//64 + j//64) % len(colors)]
-            draw.rectangle([i, j, i+64, j+64], fill=color)
-    img.save(style_dir / "picasso.jpg", quality=95)
-    print("  ✓ picasso.jpg")
-    
-    # Monet - Soft impressionist colors
-    img = Image.new('RGB', (512, 512))
-    pixels = img.load()
-    for i in range(512):
-        for j in range(512):
-            r = int(150 + 50 * np.sin(i/30))
-            g = int(180 + 50 * np.cos(j/30))
-            b = int(200 + 30 * np.sin((i+j)/40))
-            pixels[i, j] = (r, g, b)
-    img.save(style_dir / "monet.jpg", quality=95)
-    print("  ✓ monet.jpg")
-    
-    # Kandinsky - Abstract bold colors
-    img = Image.new('RGB', (512, 512))
-    draw = ImageDraw.Draw(img)
-    draw.rectangle([0, 0, 512, 512], fill=(255, 220, 100))
-    draw.ellipse([100, 100, 400, 400], fill=(255, 100, 100))
-    draw.polygon([(0, 0), (512, 0), (256, 512)], fill=(100, 100, 255))
-    draw.rectangle([200, 0, 312, 512], fill=(50, 200, 150))
-    img.save(style_dir / "kandinsky.jpg", quality=95)
-    print("  ✓ kandinsky.jpg")
+    # The four images are independent, so generate and encode them in
+    # parallel processes
+    with ProcessPoolExecutor(max_workers=len(GENERATORS)) as executor:
+        futures = [executor.submit(generator) for generator in GENERATORS]
+        for future in futures:
+            filename, data = future.result()
+            (style_dir / filename).write_bytes(data)
+            print(f"  ✓ {filename}")
     
     print(f"\n✅ Sample style images created!")
     print(f"📁 Location: {style_dir}\n")
 
 if __name__ == "__main__":
-    create_sample_styles()
\ No newline at end of file
+    create_sample_styles()
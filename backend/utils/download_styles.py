@@ -1,6 +1,9 @@
+import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Alternative URLs that are more download-friendly
 STYLE_URLS = {
@@ -10,6 +13,86 @@ STYLE_URLS = {
     "kandinsky": "https://www.artic.edu/iiif/2/40646d6f-3b9b-527c-a4be-ad7ecf823f67/full/843,/0/default.jpg"
 }
 
+# One worker per style; all URLs are on the same host, so this also caps
+# how many requests hit it at once
+MAX_WORKERS = len(STYLE_URLS)
+CHUNK_SIZE = 64 * 1024
+
+def _make_session(headers: dict) -> requests.Session:
+    """Create a session whose connection pool is shared by all workers"""
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(
+        pool_connections=MAX_WORKERS,
+        pool_maxsize=MAX_WORKERS,
+        max_retries=Retry(total=3, backoff_factor=0.3)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def _validators_path(output_path: Path) -> Path:
+    """Sidecar file holding the ETag/Last-Modified of a downloaded image"""
+    return output_path.with_name(output_path.name + ".etag")
+
+def _read_validators(validators_path: Path) -> dict:
+    """Load saved validators; an unreadable sidecar means none are known"""
+    try:
+        validators = json.loads(validators_path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return validators if isinstance(validators, dict) else {}
+
+def _write_validators(validators_path: Path, validators: dict):
+    """Save validators atomically, so an interrupted write can't corrupt them"""
+    tmp_path = validators_path.with_name(validators_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(validators))
+    tmp_path.replace(validators_path)
+
+def _download_one(session: requests.Session, style_name: str, url: str, output_path: Path) -> str:
+    """Download a single style image and return a status line"""
+    validators_path = _validators_path(output_path)
+    conditional = {}
+    if output_path.exists():
+        # Files without saved validators (e.g. from create_sample_styles.py)
+        # can't be revalidated, so leave them alone
+        if not validators_path.exists():
+            return f"  ✓ {style_name}.jpg already exists"
+        # A corrupt sidecar falls back to an unconditional GET
+        validators = _read_validators(validators_path)
+        if validators.get("ETag"):
+            conditional['If-None-Match'] = validators["ETag"]
+        if validators.get("Last-Modified"):
+            conditional['If-Modified-Since'] = validators["Last-Modified"]
+    
+    partial_path = output_path.with_name(output_path.name + ".part")
+    try:
+        # Stream the body to disk instead of holding it all in memory
+        with session.get(url, headers=conditional, timeout=30, stream=True) as response:
+            if response.status_code == 304:
+                return f"  ✓ {style_name}.jpg is fresh"
+            response.raise_for_status()
+            with open(partial_path, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+            validators = {
+                key: response.headers[key]
+                for key in ("ETag", "Last-Modified")
+                if key in response.headers
+            }
+        
+        partial_path.replace(output_path)
+        if validators:
+            _write_validators(validators_path, validators)
+        else:
+            validators_path.unlink(missing_ok=True)
+        return f"  ⬇ Downloaded {style_name} ✓ ({output_path.stat().st_size // 1024} KB)"
+        
+    except Exception as e:
+        # Don't leave a partial file behind; an existing image is kept
+        partial_path.unlink(missing_ok=True)
+        return f"  ✗ {style_name}: Error: {e}\n     URL: {url}"
+
 def download_style_images():
     """Download style reference images"""
     style_dir = Path(__file__).resolve().parent.parent.parent / "models" / "style_images"
@@ -25,30 +108,15 @@ def download_style_images():
         'Referer': 'https://www.artic.edu/',
     }
     
-    for style_name, url in STYLE_URLS.items():
-        output_path = style_dir / f"{style_name}.jpg"
-        
-        if output_path.exists():
-            print(f"  ✓ {style_name}.jpg already exists")
-            continue
-        
-        try:
-            print(f"  ⬇ Downloading {style_name}...", end=" ", flush=True)
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            
-            print(f"✓ ({len(response.content) // 1024} KB)")
-            
-            # Small delay to be respectful to the server
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"✗ Error: {e}")
-            print(f"     URL: {url}")
+    # Downloads are network-bound, so fetch all styles concurrently over
+    # one pooled keep-alive session
+    with _make_session(headers) as session, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(_download_one, session, style_name, url, style_dir / f"{style_name}.jpg")
+            for style_name, url in STYLE_URLS.items()
+        ]
+        for future in as_completed(futures):
+            print(future.result())
     
     print("\n✅ Download complete!\n")
     
@@ -1,13 +1,22 @@
 import streamlit as st
 import requests
-from PIL import Image
+from requests.adapters import HTTPAdapter
 import io
+import zipfile
 import time
+import math
 from pathlib import Path
 import uuid
 
 # Configuration
 API_BASE_URL = "http://127.0.0.1:8000"
+HEALTH_CHECK_INTERVAL = 5  # seconds
+STATUS_WAIT = 30  # seconds the backend may hold a status request open
+REQUEST_TIMEOUT = (3, 30)  # (connect, read) seconds
+GALLERY_PAGE_SIZE = 6  # tiles fetched per gallery page
+POLL_DELAY_MIN = 0.1  # seconds before retrying a failed/early status poll
+POLL_DELAY_MAX = 2.0  # cap for the exponentially growing retry delay
+POLL_BACKOFF = 1.5  # retry delay growth factor
 
 # Page configuration
 st.set_page_config(
@@ -39,6 +48,13 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def _api():
+    """HTTP session shared across reruns, keeping connections to the backend alive"""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
 # Initialize session state
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
@@ -62,14 +78,26 @@ with st.sidebar:
     
     st.markdown("---")
     
-    # API Status Check
-    try:
-        response = requests.get(f"{API_BASE_URL}/health", timeout=2)
-        if response.status_code == 200:
-            st.success("✅ Backend Online")
-        else:
-            st.error("❌ Backend Error")
-    except:
+    # Drop cached API responses on request
+    if st.button("🔄 Refresh", use_container_width=True):
+        st.cache_data.clear()
+        st.session_state.pop('_health_ts', None)
+    
+    # API Status Check (at most once every few seconds)
+    now = time.time()
+    if now - st.session_state.get('_health_ts', 0) > HEALTH_CHECK_INTERVAL:
+        try:
+            response = _api().get(f"{API_BASE_URL}/health", timeout=2)
+            st.session_state._health = "online" if response.status_code == 200 else "error"
+        except:
+            st.session_state._health = "offline"
+        st.session_state._health_ts = now
+    
+    if st.session_state._health == "online":
+        st.success("✅ Backend Online")
+    elif st.session_state._health == "error":
+        st.error("❌ Backend Error")
+    else:
         st.error("❌ Backend Offline")
     
     st.markdown("---")
@@ -85,13 +113,52 @@ with st.sidebar:
     """)
 
 # Helper Functions
+# Cached fetchers raise on failure so that errors are never cached
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_styles():
+    response = _api().get(f"{API_BASE_URL}/styles", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["styles"]
+
+@st.cache_data(ttl=10, show_spinner=False)
+def _fetch_history(session_id):
+    response = _api().get(f"{API_BASE_URL}/history/{session_id}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["transformations"]
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_gallery(limit):
+    response = _api().get(f"{API_BASE_URL}/gallery?limit={limit}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["transformations"]
+
+# Finished results never change, so they are kept for much longer; failed
+# requests raise and are not cached
+@st.cache_data(max_entries=128, ttl=3600, show_spinner=False)
+def _fetch_result(job_id, size):
+    response = _api().get(
+        f"{API_BASE_URL}/result/{job_id}",
+        params={"size": size},
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.content
+
+@st.cache_data(max_entries=32, ttl=3600, show_spinner=False)
+def _fetch_results(job_ids, size):
+    response = _api().post(
+        f"{API_BASE_URL}/results:batch",
+        json={"ids": list(job_ids), "size": size},
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        return {Path(name).stem: archive.read(name) for name in archive.namelist()}
+
 def get_available_styles():
     """Fetch available styles from API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/styles")
-        if response.status_code == 200:
-            return response.json()["styles"]
-        return {}
+        return _fetch_styles()
     except:
         return {}
 
@@ -104,10 +171,11 @@ def upload_and_transform(image_file, style):
             "session_id": st.session_state.session_id
         }
         
-        response = requests.post(
+        response = _api().post(
             f"{API_BASE_URL}/transform",
             files=files,
-            params=params
+            params=params,
+            timeout=REQUEST_TIMEOUT
         )
         
         if response.status_code == 200:
@@ -119,43 +187,45 @@ def upload_and_transform(image_file, style):
         st.error(f"Error: {str(e)}")
         return None
 
-def check_status(job_id):
-    """Check transformation status"""
+def check_status(job_id, wait=0):
+    """Check transformation status, optionally waiting up to `wait` seconds for it to finish"""
     try:
-        response = requests.get(f"{API_BASE_URL}/status/{job_id}")
+        response = _api().get(
+            f"{API_BASE_URL}/status/{job_id}",
+            params={"wait": wait},
+            timeout=(REQUEST_TIMEOUT[0], wait + 5)
+        )
         if response.status_code == 200:
             return response.json()
         return None
     except:
         return None
 
-def get_result(job_id):
-    """Download result image"""
+def get_result(job_id, size="full"):
+    """Download result JPEG bytes (size="thumb" for a small preview)"""
     try:
-        response = requests.get(f"{API_BASE_URL}/result/{job_id}")
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        return None
+        return _fetch_result(job_id, size)
     except:
         return None
 
+def get_results(job_ids, size="full"):
+    """Download several result images in one request, keyed by job id"""
+    try:
+        return _fetch_results(tuple(job_ids), size)
+    except:
+        return {}
+
 def get_history(session_id):
     """Get transformation history"""
     try:
-        response = requests.get(f"{API_BASE_URL}/history/{session_id}")
-        if response.status_code == 200:
-            return response.json()["transformations"]
-        return []
+        return _fetch_history(session_id)
     except:
         return []
 
 def get_gallery(limit=20):
     """Get gallery transformations"""
     try:
-        response = requests.get(f"{API_BASE_URL}/gallery?limit={limit}")
-        if response.status_code == 200:
-            return response.json()["transformations"]
-        return []
+        return _fetch_gallery(limit)
     except:
         return []
 
@@ -187,8 +257,9 @@ if page == "Transform":
         # Display uploaded image
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Your Original Photo", use_container_width=True)
+            # Read the upload once; preview and transform both reuse the bytes
+            st.session_state.upload_bytes = uploaded_file.getvalue()
+            st.image(st.session_state.upload_bytes, caption="Your Original Photo", use_container_width=True)
     
     # Style Selection
     st.markdown("---")
@@ -225,11 +296,8 @@ if page == "Transform":
         with col2:
             if st.button("✨ Transform My Image", type="primary", use_container_width=True):
                 with st.spinner("Uploading and starting transformation..."):
-                    # Reset file pointer
-                    uploaded_file.seek(0)
-                    
                     result = upload_and_transform(
-                        uploaded_file,
+                        io.BytesIO(st.session_state.upload_bytes),
                         st.session_state.selected_style
                     )
                     
@@ -247,9 +315,20 @@ if page == "Transform":
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        max_checks = 60  # 60 seconds timeout
-        for i in range(max_checks):
-            status = check_status(st.session_state.current_job_id)
+        max_wait = 60  # 60 seconds timeout
+        start_time = time.monotonic()
+        deadline = start_time + max_wait
+        delay = POLL_DELAY_MIN
+        while time.monotonic() < deadline:
+            # Long-poll: the backend holds the request open until the job
+            # finishes or the wait runs out
+            wait = min(STATUS_WAIT, deadline - time.monotonic())
+            poll_start = time.monotonic()
+            status = check_status(
+                st.session_state.current_job_id,
+                wait=wait
+            )
+            elapsed = time.monotonic() - start_time
             
             if status:
                 current_status = status['status']
@@ -270,24 +349,25 @@ if page == "Transform":
                         
                         with col1:
                             st.markdown("#### Original")
-                            st.image(image, use_container_width=True)
+                            st.image(st.session_state.upload_bytes, use_container_width=True)
                         
                         with col2:
                             st.markdown("#### Stylized")
                             st.image(result_image, use_container_width=True)
                         
-                        # Download button
-                        buf = io.BytesIO()
-                        result_image.save(buf, format='JPEG')
+                        # Download button serves the JPEG as received, no re-encode
                         btn = st.download_button(
                             label="💾 Download Stylized Image",
-                            data=buf.getvalue(),
+                            data=result_image,
                             file_name=f"stylized_{st.session_state.selected_style}.jpg",
                             mime="image/jpeg",
                             use_container_width=True
                         )
                     
                     st.session_state.processing = False
+                    # New result: history and gallery are now stale
+                    _fetch_history.clear()
+                    _fetch_gallery.clear()
                     break
                 
                 elif current_status == 'failed':
@@ -297,15 +377,21 @@ if page == "Transform":
                     break
                 
                 elif current_status == 'processing':
-                    progress = min((i + 1) * 100 // max_checks, 95)
+                    progress = min(int(elapsed * 100 // max_wait), 95)
                     progress_bar.progress(progress)
-                    status_text.info(f"🔄 Processing... ({i+1}s)")
+                    status_text.info(f"🔄 Processing... ({elapsed:.0f}s)")
                 
                 else:  # pending
                     progress_bar.progress(10)
                     status_text.info("⏳ Waiting to start...")
             
-            time.sleep(1)
+            # A long-poll that ran its full wait can be reissued at once; a
+            # failed or early-returning request backs off exponentially
+            if status and time.monotonic() - poll_start >= wait:
+                delay = POLL_DELAY_MIN
+            else:
+                time.sleep(max(0, min(delay, deadline - time.monotonic())))
+                delay = min(delay * POLL_BACKOFF, POLL_DELAY_MAX)
         
         if st.session_state.processing:
             st.warning("⏱️ Processing is taking longer than expected. Check History page later.")
@@ -375,27 +461,34 @@ elif page == "Gallery":
     else:
         st.success(f"Showing {len(gallery_items)} recent transformation(s)")
         
+        # Only the current page's thumbnails are fetched and decoded
+        page_count = math.ceil(len(gallery_items) / GALLERY_PAGE_SIZE)
+        page_number = st.selectbox("Page", range(1, page_count + 1)) if page_count > 1 else 1
+        start = (page_number - 1) * GALLERY_PAGE_SIZE
+        visible_items = gallery_items[start:start + GALLERY_PAGE_SIZE]
+        
+        # Fetch the page's thumbnails in one request
+        results = get_results([item['job_id'] for item in visible_items], size="thumb")
+        
         # Display in grid
         cols_per_row = 3
         
-        for i in range(0, len(gallery_items), cols_per_row):
+        for i in range(0, len(visible_items), cols_per_row):
             cols = st.columns(cols_per_row)
             
             for j in range(cols_per_row):
                 idx = i + j
-                if idx < len(gallery_items):
-                    item = gallery_items[idx]
+                if idx < len(visible_items):
+                    item = visible_items[idx]
                     
                     with cols[j]:
                         st.markdown(f"**{item['style_name'].title()}**")
                         st.caption(f"{item['created_at']}")
                         
-                        # Try to load and display image
-                        try:
-                            result_img = get_result(item['job_id'])
-                            if result_img:
-                                st.image(result_img, use_container_width=True)
-                        except:
+                        result_img = results.get(item['job_id'])
+                        if result_img:
+                            st.image(result_img, use_container_width=True)
+                        else:
                             st.info("Image not available")
 
 # Footer